@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import bids
+
+from . import validation, vectorized
+
+lgr = logging.getLogger(__name__)
+DEBUG = bool(os.environ.get("DEBUG", False))
+lgr.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+
+def read_datasets(paths: list[str]) -> list[str]:
+    # expands the list of datasets given to the batch command:
+    # a folder is a BIDS dataset, a .json file a list of datasets, any other file one dataset per line
+    # (blank lines and lines starting with # are ignored), relative paths are relative to the listing file
+    # a path that does not exist is kept as a dataset, to be reported as a DatasetError by validate_dataset
+    datasets = []
+    for path in paths:
+        if os.path.isdir(path) or not os.path.exists(path):
+            datasets.append(os.path.abspath(path))
+            continue
+        with open(path) as fd:
+            if path.endswith(".json"):
+                listed_paths = json.load(fd)
+                if not isinstance(listed_paths, list) or not all(isinstance(p, str) for p in listed_paths):
+                    raise ValueError(f"{path} should contain a list of dataset paths")
+            else:
+                listed_paths = [line.strip() for line in fd if line.strip() and not line.lstrip().startswith("#")]
+        manifest_dir = os.path.dirname(os.path.abspath(path))
+        datasets.extend(os.path.abspath(os.path.join(manifest_dir, p)) for p in listed_paths)
+    return datasets
+
+
+def validate_dataset(bids_path: str, subject, session, vectorize: bool = False) -> dict:
+    # validates a single dataset of the batch and summarizes the errors
+    # the loaded configs and schemas are cached in the module of the (worker) process and reused between datasets
+    # a dataset that cannot be validated (eg. invalid BIDS, missing `.forbids`) is reported as a DatasetError
+    lgr.info("validating dataset %s", bids_path)
+    deviations = {} if vectorize else None
+    errors = []
+    try:
+        if not os.path.isdir(bids_path):
+            raise FileNotFoundError(f"dataset {bids_path} does not exist")
+        layout = bids.BIDSLayout(bids_path)
+        for error in validation.validate(
+            layout,
+            vectorize=vectorize,
+            deviations=deviations,
+            share_bundles=True,
+            subject=subject,
+            session=session,
+        ):
+            error_type, filepath, tag_path, message = validation.format_error(error)
+            lgr.error("%s %s %s %s : %s", os.path.basename(bids_path), error_type, filepath, tag_path, message)
+            errors.append({"type": error_type, "file": filepath, "path": tag_path, "message": message})
+    except Exception as exc:
+        lgr.error("%s DatasetError : %s", os.path.basename(bids_path), exc)
+        lgr.debug("failed to validate %s", bids_path, exc_info=True)
+        errors.append({"type": "DatasetError", "message": str(exc)})
+    summary = {
+        "dataset": bids_path,
+        "compliant": not errors,
+        "num_errors": len(errors),
+        "errors_by_type": dict(Counter(error["type"] for error in errors)),
+        "errors": errors,
+    }
+    if deviations is not None:
+        summary["deviations"] = vectorized.summarize_deviations(deviations)
+    return summary
+
+
+def process_batch(
+    bids_paths: list[str],
+    subject,
+    session,
+    vectorize: bool = False,
+    jobs: int = 1,
+    report_path: str | None = None,
+) -> bool:
+    # validates several datasets in one process (or a pool of `jobs` worker processes)
+    # and produces a combined report with per-dataset summaries
+
+    datasets = read_datasets(bids_paths)
+    args = (datasets, [subject] * len(datasets), [session] * len(datasets), [vectorize] * len(datasets))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            summaries = list(executor.map(validate_dataset, *args))
+    else:
+        try:
+            summaries = list(map(validate_dataset, *args))
+        finally:
+            validation.clear_caches()
+
+    report = {
+        "num_datasets": len(summaries),
+        "num_compliant": sum(summary["compliant"] for summary in summaries),
+        "num_errors": sum(summary["num_errors"] for summary in summaries),
+        "datasets": summaries,
+    }
+    for summary in summaries:
+        if summary["compliant"]:
+            lgr.info("%s: compliant", summary["dataset"])
+        else:
+            lgr.error("%s: %d errors %s", summary["dataset"], summary["num_errors"], summary["errors_by_type"])
+    if report_path:
+        with open(report_path, "wt") as fd:
+            json.dump(report, fd, indent=2)
+
+    success = report["num_compliant"] == report["num_datasets"]
+    if success:
+        lgr.info("All %d datasets were successfully checked as compliant to the protocol.", report["num_datasets"])
+    else:
+        lgr.error(
+            "%d of %d datasets failed to comply to the protocol.",
+            report["num_datasets"] - report["num_compliant"],
+            report["num_datasets"],
+        )
+    return success
@@ -7,6 +7,7 @@ import os
 import bids
 import coloredlogs
 
+from ..batch import process_batch, read_datasets
 from ..init import initialize
 from ..validation import process_validation
 
@@ -30,8 +31,12 @@ lgr = logging.getLogger(__name__)
 def parse_args() -> argparse.Namespace:
 
     p = argparse.ArgumentParser(description="forbids - setup and validate protocol compliance")
-    p.add_argument("command", help="init or validate")
-    p.add_argument("bids_path", help="path to the BIDS dataset")
+    p.add_argument("command", help="init, validate or batch")
+    p.add_argument(
+        "bids_path",
+        nargs="+",
+        help="path to the BIDS dataset, batch: paths to the datasets or to files listing them (.json or one per line)",
+    )
     p.add_argument(
         "--session-specific",
         action="store_true",
@@ -51,25 +56,61 @@ def parse_args() -> argparse.Namespace:
         default=False,
         help="allow schema to be specific to the scanner software version",
     )
+    p.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="init: skip the series already recorded in the .forbids manifest whose inputs did not change",
+    )
+    p.add_argument(
+        "--vectorize",
+        action="store_true",
+        default=False,
+        help="check numeric tags for all runs of a series at once and report per-tag deviation statistics",
+    )
+    p.add_argument("--jobs", type=int, default=1, help="batch: number of worker processes")
+    p.add_argument("--report", help="batch: path of the combined json report")
     p.add_argument("--participant-label", nargs="+", default=bids.layout.Query.ANY)
     p.add_argument("--session-label", nargs="*", default=[bids.layout.Query.NONE, bids.layout.Query.ANY])
-    return p.parse_args()
+    args = p.parse_args()
+    if args.command != "batch" and len(args.bids_path) > 1:
+        p.error(f"{args.command} takes a single dataset, use batch to process several")
+    if args.command == "batch":
+        try:
+            args.bids_path = read_datasets(args.bids_path)
+        except (OSError, ValueError) as error:
+            p.error(f"invalid list of datasets: {error}")
+    return args
 
 
 def main() -> None:
     args = parse_args()
-    layout = bids.BIDSLayout(os.path.abspath(args.bids_path))
     success = False
 
+    if args.command == "batch":
+        success = process_batch(
+            args.bids_path,
+            subject=args.participant_label,
+            session=args.session_label,
+            vectorize=args.vectorize,
+            jobs=args.jobs,
+            report_path=args.report,
+        )
+        exit(0 if success else 1)
+
+    layout = bids.BIDSLayout(os.path.abspath(args.bids_path[0]))
     if args.command == "init":
         success = initialize(
             layout,
             uniform_sessions=not args.session_specific,
             uniform_instruments=not args.scanner_specific,
             version_specific=args.version_specific,
+            resume=args.resume,
         )
     elif args.command == "validate":
-        success = process_validation(layout, subject=args.participant_label, session=args.session_label)
+        success = process_validation(
+            layout, subject=args.participant_label, session=args.session_label, vectorize=args.vectorize
+        )
     exit(0 if success else 1)
 
 
@@ -3,19 +3,23 @@
 #   -------------------------------------------------------------
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import os
 from collections import OrderedDict
 from importlib.resources import files
+from typing import Any
 
 import bids
 from apischema.json_schema import deserialization_schema
 from jsonschema.exceptions import ValidationError
 
-from . import schema
+from . import records, schema
 
 configs = {}
+# manifest of the series processed by `initialize`, dotfile so that pybids does not index it with the schemas
+MANIFEST_FILENAME = ".init_manifest.json"
 lgr = logging.getLogger(__name__)
 
 DEBUG = bool(os.environ.get("DEBUG", False))
@@ -39,17 +43,90 @@ def get_config(datatype):
     return configs[modality]
 
 
+def write_json_atomic(path: str, data: Any) -> None:
+    # writes to a temporary dotfile next to the destination then renames it,
+    # so that an interrupted run never leaves a truncated json file
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    try:
+        with open(tmp_path, "wt") as fd:
+            json.dump(data, fd, indent=2)
+            # make sure the content is on disk before the rename (eg. node crash, network filesystem)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_manifest(bids_layout: bids.BIDSLayout) -> dict:
+    # loads the manifest of series completed by previous `initialize` runs
+    # a corrupted manifest is discarded, all series are then generated again
+    manifest_path = os.path.join(bids_layout.root, schema.FORBIDS_SCHEMA_FOLDER, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {"series": {}}
+    try:
+        with open(manifest_path) as fd:
+            manifest = json.load(fd)
+    except ValueError as error:
+        lgr.warning("ignoring corrupted manifest %s: %s", manifest_path, error)
+        return {"series": {}}
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("series"), dict):
+        lgr.warning("ignoring corrupted manifest %s: unexpected structure", manifest_path)
+        return {"series": {}}
+    return manifest
+
+
+def save_manifest(bids_layout: bids.BIDSLayout, manifest: dict) -> None:
+    forbids_path = os.path.join(bids_layout.root, schema.FORBIDS_SCHEMA_FOLDER)
+    os.makedirs(forbids_path, exist_ok=True)
+    write_json_atomic(os.path.join(forbids_path, MANIFEST_FILENAME), manifest)
+
+
+def get_series_key(series_entities: dict) -> str:
+    # unique and stable key of a series in the manifest
+    return json.dumps(
+        {k: v for k, v in series_entities.items() if not isinstance(v, bids.layout.Query)},
+        sort_keys=True,
+    )
+
+
+def hash_dataset_inputs(bids_layout: bids.BIDSLayout, options: dict) -> str:
+    # hashes the inputs shared by all series: the init options and the subjects/sessions (for the number of runs)
+    digest = hashlib.sha256()
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    for subject in sorted(bids_layout.get_subjects()):
+        digest.update(json.dumps([subject, sorted(bids_layout.get_session(subject=subject))]).encode())
+    return digest.hexdigest()
+
+
+def hash_series_inputs(bids_layout: bids.BIDSLayout, dataset_digest: str, **series_entities: dict) -> str:
+    # hashes everything the schema of a series is generated from:
+    # the dataset inputs (see hash_dataset_inputs), the config and the sidecars content
+    digest = hashlib.sha256(dataset_digest.encode())
+    digest.update(json.dumps(get_config(series_entities.get("datatype")), sort_keys=True).encode())
+    for sidecar in sorted(bids_layout.get(**series_entities), key=lambda sc: sc.relpath):
+        digest.update(sidecar.relpath.encode())
+        with open(sidecar.path, "rb") as fd:
+            digest.update(hashlib.sha256(fd.read()).digest())
+    return digest.hexdigest()
+
+
 def initialize(
     bids_layout: bids.BIDSLayout,
     uniform_instruments: bool = True,
     uniform_sessions: bool = False,
     version_specific: bool = False,
     instrument_grouping_tags: tuple = tuple(),
+    resume: bool = False,
 ) -> None:
     # generates schemas from exemplar data for all unique set of entities
     # (but factoring subject, run and session if uniform_sessions)
     # attempts to group exemplar data by shared instrument tags going from coarser to finer grouping
     # if uniform_instruments is false, it also allows to group per unique instruments
+    # completed series are recorded in a manifest in the `.forbids` folder,
+    # if resume, the series whose inputs did not change since they were recorded are skipped
 
     all_datatypes = bids_layout.get_datatype()
 
@@ -57,6 +134,15 @@ def initialize(
     excl_ents = ["subject", "run"] + (["session"] if uniform_sessions else [])
 
     successes = []
+    manifest = load_manifest(bids_layout)
+    dataset_digest = hash_dataset_inputs(
+        bids_layout,
+        {
+            "uniform_instruments": uniform_instruments,
+            "uniform_sessions": uniform_sessions,
+            "version_specific": version_specific,
+        },
+    )
 
     for datatype in all_datatypes:
         lgr.info("processing %s", datatype)
@@ -75,13 +161,35 @@ def initialize(
             for entity in schema.ALT_ENTITIES:
                 if entity not in series_entities:
                     series_entities[entity] = bids.layout.Query.NONE
-            success = generate_series_model(
+            series_key = get_series_key(series_entities)
+            input_hash = hash_series_inputs(bids_layout, dataset_digest, **series_entities)
+            series_record = manifest["series"].get(series_key)
+            if (
+                resume
+                and series_record
+                and series_record["input_hash"] == input_hash
+                and os.path.exists(
+                    os.path.join(bids_layout.root, schema.FORBIDS_SCHEMA_FOLDER, series_record["schema_path"])
+                )
+            ):
+                lgr.info("skipping %s, unchanged since last run", series_key)
+                successes.append(True)
+                continue
+
+            series_record = generate_series_model(
                 bids_layout,
                 uniform_instruments=uniform_instruments,
                 version_specific=version_specific,
                 **series_entities,
             )
-            successes.append(success)
+            if series_record:
+                series_record["entities"] = json.loads(series_key)
+                series_record["input_hash"] = input_hash
+                manifest["series"][series_key] = series_record
+            else:
+                manifest["series"].pop(series_key, None)
+            save_manifest(bids_layout, manifest)
+            successes.append(series_record is not None)
     return all(successes)
 
 
@@ -91,10 +199,11 @@ def generate_series_model(
     uniform_sessions: bool = True,
     version_specific: bool = False,
     **series_entities: dict,
-):
+) -> dict | None:
     # generates schemas from exemplar data for single set of entities describing the "series"
     # attempts to group exemplar data by shared instrument tags going from coarser to finer grouping
     # if uniform_instruments is false, it also allows to group per unique instruments
+    # returns the manifest record of the generated schema, None if no grouping worked
 
     config = get_config(series_entities.get("datatype"))
     grouping_tags = config["instrument"]["grouping_tags"].copy()
@@ -113,6 +222,9 @@ def generate_series_model(
         if hasattr(bids_layout, getter):
             instrument_groups[tag] = getattr(bids_layout, getter)(**series_entities)
 
+    # compact records of the series sidecars, loaded once for all groupings
+    series_sidecars = records.get_records(bids_layout, records.get_config_tags(config), **series_entities)
+
     instrument_query_tags = []
     # try grouping from more global to finer, (eg. first manufacturer, then scanner, then scanner+coil, ...)
     for instrument_tag, _ in instrument_groups.items():
@@ -120,7 +232,6 @@ def generate_series_model(
         instrument_query_tags.append(instrument_tag)
 
         non_null_entities = {k: v for k, v in series_entities.items() if not isinstance(v, bids.layout.Query)}
-        series_sidecars = bids_layout.get(**series_entities)
         series_subjects = bids_layout.get_subjects(**series_entities)
         sidecars_by_instrument_group = {}
         # groups sidecars by instrument tags
@@ -185,11 +296,13 @@ def generate_series_model(
             "min_runs": min(runs_per_session),
             "max_runs": max(runs_per_session),
         }
-        with open(schema_path_abs, "wt") as fd:
-            json.dump(json_schema, fd, indent=2)
+        write_json_atomic(schema_path_abs, json_schema)
 
         lgr.info("Successfully generated schema with grouping %s", str(instrument_query_tags))
-        return True
+        return {
+            "schema_path": schema_path,
+            "instrument_tags": instrument_query_tags,
+        }
     else:
         lgr.error("failed to generate a schema for %s", str(series_entities))
-        return False
+        return None
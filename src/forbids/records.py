@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import sys
+from typing import Any
+
+import bids
+
+# marks the tags absent from a sidecar in SidecarRecord values
+MISSING = object()
+
+
+def intern_value(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def intern_entities(entities: dict) -> tuple:
+    # flattens the entities to (entity1, value1, entity2, value2, ...) with interned strings
+    return tuple(intern_value(item) for entity_value in entities.items() for item in entity_value)
+
+
+def get_config_tags(config: dict) -> tuple:
+    # the tags of a sidecar that forbids uses: the schema properties and the instrument tags
+    tags = list(config["properties"])
+    for instrument_tags in config["instrument"].values():
+        tags.extend(t for t in instrument_tags if t not in tags)
+    return tuple(sys.intern(t) for t in tags)
+
+
+class SidecarRecord:
+    # compact representation of a BIDS sidecar, used instead of pybids BIDSJSONFile after discovery
+    # only keeps the relative path, the interned entities and the values of the configured tags
+
+    __slots__ = ("relpath", "_entities", "_tags", "_values")
+
+    def __init__(self, relpath: str, entities: dict, metadata: dict, tags: tuple):
+        self.relpath = relpath
+        self._entities = intern_entities(entities)
+        self._tags = tags
+        self._values = tuple(intern_value(metadata[t]) if t in metadata else MISSING for t in tags)
+
+    @classmethod
+    def from_bidsfile(cls, bids_file: bids.layout.BIDSJSONFile, tags: tuple) -> SidecarRecord:
+        return cls(bids_file.relpath, bids_file.entities, bids_file.get_dict(), tags)
+
+    @property
+    def entities(self) -> dict:
+        return dict(zip(self._entities[::2], self._entities[1::2]))
+
+    def get_dict(self) -> dict:
+        # the configured tags present in the sidecar, same interface as BIDSJSONFile
+        return {t: v for t, v in zip(self._tags, self._values) if v is not MISSING}
+
+    def __repr__(self) -> str:
+        return f"<SidecarRecord {self.relpath}>"
+
+
+def get_records(bids_layout: bids.BIDSLayout, tags: tuple, **filters: dict) -> list[SidecarRecord]:
+    # queries the layout for sidecars and converts them to compact records
+    return [SidecarRecord.from_bidsfile(bids_file, tags) for bids_file in bids_layout.get(**filters)]
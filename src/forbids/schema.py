@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hashlib
 import keyword
 import logging
 import os
@@ -14,6 +15,8 @@ import openapi_schema_validator.validators
 from apischema import discriminator, schema
 from apischema.json_schema import deserialization_schema
 
+from .records import SidecarRecord
+
 lgr = logging.getLogger(__name__)
 DEBUG = bool(os.environ.get("DEBUG", False))
 lgr.setLevel(logging.DEBUG if DEBUG else logging.INFO)
@@ -86,6 +89,20 @@ def sidecar2schema(sidecar: dict, config_props: dict, subschema_name: str):
     return make_dataclass(subschema_name, fields=list(struct2schemaprops(sidecar, config_props, subschema_name)))
 
 
+def get_bundle_digest(forbids_path: str) -> str:
+    # hashes the schemas of a `.forbids` folder (ignoring dotfiles as pybids does)
+    # so that datasets sharing an identical bundle can share the loaded schemas
+    digest = hashlib.sha256()
+    for root, dirs, filenames in os.walk(forbids_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for filename in sorted(f for f in filenames if not f.startswith(".")):
+            path = os.path.join(root, filename)
+            digest.update(os.path.relpath(path, forbids_path).encode())
+            with open(path, "rb") as fd:
+                digest.update(hashlib.sha256(fd.read()).digest())
+    return digest.hexdigest()
+
+
 def get_validator(sidecar_schema: dict) -> jsonschema.validators._Validator:
     # return OpenApi validator for use of discriminator feature
     validator_cls = openapi_schema_validator.validators.OAS31Validator
@@ -95,7 +112,7 @@ def get_validator(sidecar_schema: dict) -> jsonschema.validators._Validator:
 
 
 def sidecars2unionschema(
-    sidecars_groups: dict[Any, list[bids.layout.BIDSJSONFile]],
+    sidecars_groups: dict[Any, list[SidecarRecord]],
     bids_layout: bids.BIDSLayout,
     config_props: dict,
     series_entities: dict,
@@ -174,7 +191,7 @@ def get_instrument_key(
 
 
 def prepare_metadata(
-    sidecar: bids.layout.BIDSJSONFile,
+    sidecar: SidecarRecord | bids.layout.BIDSJSONFile,
     instrument_tags: List[str],
 ):
     # prepares sidecar data for use with json_schema
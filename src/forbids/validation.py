@@ -11,7 +11,15 @@ import bids
 from jsonschema._utils import Unset
 from jsonschema.exceptions import ValidationError
 
-from . import schema
+from . import records, schema, vectorized
+from .init import get_config
+
+
+# caches shared by the datasets validated in the same process (see batch.py), keyed by `.forbids` bundle digest
+# only the most recently used bundles are kept
+MAX_CACHED_BUNDLES = 4
+ref_layouts = {}
+series_schemas = {}
 
 
 class BIDSJSONError(ValidationError):
@@ -24,16 +32,78 @@ class BIDSFileError(ValidationError):
     pass
 
 
-def validate(bids_layout: bids.BIDSLayout, **entities: dict[str, str | list]):
+def clear_caches(bundle_digest: str | None = None) -> None:
+    # drops the cached layouts and schemas of a bundle, or of all bundles
+    for digest in [bundle_digest] if bundle_digest else list(ref_layouts):
+        ref_layouts.pop(digest, None)
+        for key in [key for key in series_schemas if key[0] == digest]:
+            del series_schemas[key]
+
+
+def get_ref_layout(bids_layout: bids.BIDSLayout, share_bundles: bool = False) -> tuple[str | None, bids.BIDSLayout]:
+    # returns the digest and layout of the `.forbids` folder
+    # if share_bundles, the layout is indexed once per identical bundle, otherwise it is not cached (digest is None)
+    forbids_path = os.path.join(bids_layout.root, schema.FORBIDS_SCHEMA_FOLDER)
+    if not os.path.isdir(forbids_path):
+        raise FileNotFoundError(
+            f"no {schema.FORBIDS_SCHEMA_FOLDER} folder in {bids_layout.root}, run `forbids init` to create the schemas"
+        )
+    if not share_bundles:
+        return None, bids.BIDSLayout(forbids_path, validate=False)
+
+    bundle_digest = schema.get_bundle_digest(forbids_path)
+    if bundle_digest in ref_layouts:
+        lgr.debug("reusing schemas loaded for an identical bundle %s", bundle_digest)
+        # move to the end as most recently used
+        ref_layouts[bundle_digest] = ref_layouts.pop(bundle_digest)
+    else:
+        while len(ref_layouts) >= MAX_CACHED_BUNDLES:
+            clear_caches(next(iter(ref_layouts)))
+        ref_layouts[bundle_digest] = bids.BIDSLayout(forbids_path, validate=False)
+    return bundle_digest, ref_layouts[bundle_digest]
+
+
+def get_series_schema(
+    bundle_digest: str | None, ref_sidecar: bids.layout.BIDSJSONFile, vectorize: bool = False
+) -> tuple:
+    # loads a series schema and compiles its validator, once per identical bundle if bundle_digest is set
+
+    # Returns:
+    #   bidsfile_constraints: the forbids specific "bids" part of the schema
+    #   validator: the jsonschema validator (of the residual schema if vectorize)
+    #   numeric_constraints: the numeric constraints to check with vectorized, empty if not vectorize
+    key = (bundle_digest, ref_sidecar.relpath, vectorize)
+    if key in series_schemas:
+        return series_schemas[key]
+
+    sidecar_schema = ref_sidecar.get_dict()
+    bidsfile_constraints = sidecar_schema.pop("bids", dict())
+    numeric_constraints = {}
+    if vectorize:
+        sidecar_schema, numeric_constraints = vectorized.split_numeric_constraints(sidecar_schema)
+    series_schema = (bidsfile_constraints, schema.get_validator(sidecar_schema), numeric_constraints)
+    if bundle_digest is not None:
+        series_schemas[key] = series_schema
+    return series_schema
+
+
+def validate(
+    bids_layout: bids.BIDSLayout,
+    vectorize: bool = False,
+    deviations: dict[tuple, list] | None = None,
+    share_bundles: bool = False,
+    **entities: dict[str, str | list],
+):
     # validates the data specified by entities using the schema present in the `.forbids` folder
+    # if vectorize, the numeric tags are checked for all runs of a series at once (see vectorized.py)
+    # and the deviations from the expected values are gathered in `deviations` if provided
+    # if share_bundles, the schemas are cached for the datasets sharing an identical `.forbids` bundle
 
-    ref_layout = bids.BIDSLayout(os.path.join(bids_layout.root, schema.FORBIDS_SCHEMA_FOLDER), validate=False)
+    bundle_digest, ref_layout = get_ref_layout(bids_layout, share_bundles)
 
     # get sidecars for the session or ones factored at a higher level
     ref_sidecars = ref_layout.get(session=[entities.get("session"), None], extension=".json")
 
-    all_sidecars = bids_layout.get(extension=".json", **entities)
-
     subjects = bids_layout.get_subject(subject=entities.pop("subject"))
 
     is_multisession = len(bids_layout.get_session())
@@ -41,23 +111,27 @@ def validate(bids_layout: bids.BIDSLayout, **entities: dict[str, str | list]):
     if is_multisession:
         lgr.info("The dataset is multi-session.")
 
-    all_sidecars = bids_layout.get(
-        extension=".json",
-        subject=subjects,
-        session=entities["session"],
-    )
+    # relative paths of the sidecars not matched by any schema yet
+    unexpected_sidecars = {
+        sidecar.relpath
+        for sidecar in bids_layout.get(
+            extension=".json",
+            subject=subjects,
+            session=entities["session"],
+        )
+    }
 
     for ref_sidecar in ref_sidecars:
         lgr.info("validating %s", str(ref_sidecar.relpath))
         # load the schema
-        sidecar_schema = ref_sidecar.get_dict()
-        bidsfile_constraints = sidecar_schema.pop("bids", dict())
+        bidsfile_constraints, validator, numeric_constraints = get_series_schema(bundle_digest, ref_sidecar, vectorize)
         query_entities = ref_sidecar.entities.copy()
+        config_tags = records.get_config_tags(get_config(query_entities["datatype"]))
 
         for entity in schema.ALT_ENTITIES:
             if entity not in query_entities:
                 query_entities[entity] = bids.layout.Query.NONE
-        validator = schema.get_validator(sidecar_schema)
+        numeric_sidecars = []
 
         for subject in subjects:
             query_entities["subject"] = subject
@@ -84,7 +158,7 @@ def validate(bids_layout: bids.BIDSLayout, **entities: dict[str, str | list]):
                     session_instrument_tags, bidsfile_constraints["instrument_tags"]
                 )
 
-                sidecars_to_validate = bids_layout.get(**query_entities)
+                sidecars_to_validate = records.get_records(bids_layout, config_tags, **query_entities)
 
                 if not sidecars_to_validate:
                     if not bidsfile_constraints.get("optional", False):
@@ -108,15 +182,23 @@ def validate(bids_layout: bids.BIDSLayout, **entities: dict[str, str | list]):
                     )
 
                 for sidecar in sidecars_to_validate:
-                    if sidecar in all_sidecars:
-                        all_sidecars.remove(sidecar)
+                    if sidecar.relpath in unexpected_sidecars:
+                        unexpected_sidecars.remove(sidecar.relpath)
                     else:
                         lgr.error("an error occurred")
                     lgr.debug("validating %s", sidecar.relpath)
                     sidecar_data = schema.prepare_metadata(sidecar, bidsfile_constraints["instrument_tags"])
                     yield from add_path_note_to_error(validator, sidecar_data, sidecar.relpath)
-    for extra_sidecar in all_sidecars:
-        yield BIDSFileError(f"Unexpected BIDS file {extra_sidecar.relpath}")
+                    if numeric_constraints:
+                        numeric_sidecars.append(
+                            (sidecar.relpath, vectorized.get_numeric_values(sidecar_data, numeric_constraints))
+                        )
+        if numeric_constraints:
+            yield from vectorized.iter_numeric_errors(
+                numeric_sidecars, numeric_constraints, deviations, series=ref_sidecar.relpath
+            )
+    for extra_sidecar in sorted(unexpected_sidecars):
+        yield BIDSFileError(f"Unexpected BIDS file {extra_sidecar}")
 
 
 def add_path_note_to_error(validator, sidecar_data, filepath):
@@ -128,26 +210,46 @@ def add_path_note_to_error(validator, sidecar_data, filepath):
         yield error
 
 
-def process_validation(layout, subject, session):
+def format_error(error: ValidationError) -> tuple[str, str, str, str]:
+    # format an error for not-to-verbose pretty printing
+
+    # Returns:
+    #   (error type, file path, tag path, message)
+    formatted_message = error.message
+    if len(error.path) == 0 and not isinstance(error.instance, Unset) and not error.relative_schema_path[0] == 'required':
+        formatted_message = f"non-existing schema for instrument {error.instance['__instrument__']}"
+
+    return (
+        error.__class__.__name__,
+        error.__notes__[0] if hasattr(error, "__notes__") else "",
+        ".".join([str(e) for e in error.absolute_path]),
+        formatted_message,
+    )
+
+
+def process_validation(layout, subject, session, vectorize=False):
     # run validation on the BIDS layout and specified subject/session
     # format errors for not-to-verbose pretty printing
 
     no_error = True
-    for error in validate(layout, subject=subject, session=session):
+    deviations = {} if vectorize else None
+    for error in validate(layout, vectorize=vectorize, deviations=deviations, subject=subject, session=session):
         no_error = False
-
-        formatted_message = error.message
-        if len(error.path) == 0 and not isinstance(error.instance, Unset) and not error.relative_schema_path[0] == 'required':
-            formatted_message = f"non-existing schema for instrument {error.instance['__instrument__']}"
-
-        lgr.error(
-            "%s %s %s : %s",
-            error.__class__.__name__,
-            error.__notes__[0] if hasattr(error, "__notes__") else "",
-            ".".join([str(e) for e in error.absolute_path]),
-            formatted_message,
-        )
+        lgr.error("%s %s %s : %s", *format_error(error))
         lgr.debug(error)
+    if deviations:
+        for stats in vectorized.summarize_deviations(deviations):
+            lgr.info(
+                "%s %s %s: %d/%d failing, deviation mean %g, std %g, max abs %g",
+                stats["series"],
+                stats["instrument"],
+                stats["tag"],
+                stats["failing"],
+                stats["count"],
+                stats["mean"],
+                stats["std"],
+                stats["max_abs"],
+            )
     if no_error:
         lgr.info("The dataset was successfully checked as compliant to the protocol.")
     else:
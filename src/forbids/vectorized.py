@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import copy
+import logging
+import os
+from typing import Any, Iterator
+
+import numpy as np
+from jsonschema.exceptions import ValidationError
+
+lgr = logging.getLogger(__name__)
+DEBUG = bool(os.environ.get("DEBUG", False))
+lgr.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+NUMERIC_TYPES = ("number", "integer")
+# keywords that can be checked on arrays, a property using any other keyword is left to jsonschema
+NUMERIC_KEYWORDS = {"type", "const", "minimum", "maximum"}
+
+
+def resolve_ref(sidecar_schema: dict, subschema: dict) -> dict:
+    # follow local "$ref" (eg. "#/$defs/name") until reaching an actual subschema
+    while isinstance(subschema, dict) and "$ref" in subschema:
+        ref = subschema["$ref"]
+        if not ref.startswith("#/"):
+            break
+        subschema = sidecar_schema
+        for part in ref[2:].split("/"):
+            subschema = subschema[part.replace("~1", "/").replace("~0", "~")]
+    return subschema
+
+
+def get_numeric_constraint(sidecar_schema: dict, prop_schema: dict) -> dict | None:
+    # returns the const/min/max constraint of a property if it can be checked on arrays
+
+    prop_schema = resolve_ref(sidecar_schema, prop_schema)
+    if not isinstance(prop_schema, dict) or prop_schema.get("type") not in NUMERIC_TYPES:
+        return None
+    if not set(prop_schema).issubset(NUMERIC_KEYWORDS) or len(prop_schema) < 2:
+        return None
+    if isinstance(prop_schema.get("const"), bool):
+        return None
+    return prop_schema
+
+
+def iter_instrument_subschemas(sidecar_schema: dict) -> Iterator[tuple[str, dict]]:
+    # yields the (instrument key, subschema) of all the object schemas discriminated by instrument
+    candidates = [sidecar_schema]
+    for keyword in ("oneOf", "anyOf"):
+        candidates.extend(sidecar_schema.get(keyword, []))
+    candidates.extend(sidecar_schema.get("$defs", {}).values())
+
+    seen = []
+    for candidate in candidates:
+        subschema = resolve_ref(sidecar_schema, candidate)
+        if not isinstance(subschema, dict) or any(subschema is s for s in seen):
+            continue
+        seen.append(subschema)
+        instrument_schema = resolve_ref(sidecar_schema, subschema.get("properties", {}).get("__instrument__", {}))
+        if isinstance(instrument_schema, dict) and isinstance(instrument_schema.get("const"), str):
+            yield instrument_schema["const"], subschema
+
+
+def split_numeric_constraints(sidecar_schema: dict) -> tuple[dict, dict[str, dict[str, dict]]]:
+    # split a series schema into numeric constraints that can be checked for all runs at once
+    # and a residual schema with these properties removed, to be validated with jsonschema
+
+    # Returns:
+    #   residual_schema: a copy of the schema without the numeric properties
+    #   constraints: {instrument_key: {tag: {"type":..., "const":...} or {"type":..., "minimum":..., "maximum":...}}}
+    residual_schema = copy.deepcopy(sidecar_schema)
+    instrument_subschemas = list(iter_instrument_subschemas(residual_schema))
+    instrument_keys = [instrument_key for instrument_key, _ in instrument_subschemas]
+    constraints = {}
+    for instrument_key, subschema in instrument_subschemas:
+        if instrument_keys.count(instrument_key) > 1:
+            # ambiguous instrument, all its subschemas are left untouched for jsonschema to handle
+            lgr.debug("instrument %s has several subschemas, not vectorized", instrument_key)
+            continue
+        instrument_constraints = {}
+        for tag, prop_schema in list(subschema.get("properties", {}).items()):
+            constraint = get_numeric_constraint(residual_schema, prop_schema)
+            if constraint is not None:
+                instrument_constraints[tag] = dict(constraint)
+                # the tag stays listed in "required" so that jsonschema still reports missing tags
+                del subschema["properties"][tag]
+        lgr.debug("instrument %s: %d numeric constraints vectorized", instrument_key, len(instrument_constraints))
+        constraints[instrument_key] = instrument_constraints
+    return residual_schema, constraints
+
+
+def get_numeric_values(sidecar_data: dict, constraints: dict[str, dict[str, dict]]) -> dict:
+    # keeps only the instrument key and the values of the constrained tags of a sidecar,
+    # to hold all the runs of a series until they are checked by iter_numeric_errors
+    instrument_key = sidecar_data.get("__instrument__")
+    numeric_values = {tag: sidecar_data[tag] for tag in constraints.get(instrument_key, {}) if tag in sidecar_data}
+    numeric_values["__instrument__"] = instrument_key
+    return numeric_values
+
+
+def gather_numeric_values(sidecars_data: list[dict], tag: str, integer: bool = False) -> tuple[np.ndarray, ...]:
+    # gathers the value of a tag for all sidecars into an array
+
+    # Returns:
+    #   values: float array of the tag values, NaN where missing or non-numeric
+    #   present: bool array, the tag is present in the sidecar
+    #   wrong_type: bool array, the tag is present but not a number (or integer)
+    values = np.full(len(sidecars_data), np.nan)
+    present = np.zeros(len(sidecars_data), dtype=bool)
+    wrong_type = np.zeros(len(sidecars_data), dtype=bool)
+    for idx, sidecar_data in enumerate(sidecars_data):
+        if tag not in sidecar_data:
+            continue
+        present[idx] = True
+        value = sidecar_data[tag]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            wrong_type[idx] = True
+        elif integer and not float(value).is_integer():
+            wrong_type[idx] = True
+        else:
+            values[idx] = value
+    return values, present, wrong_type
+
+
+def numeric_error(
+    message: str, tag: str, keyword: str, constraint: dict, instance: Any, filepath: str
+) -> ValidationError:
+    # build an error similar to the one jsonschema would have raised for that sidecar
+    error = ValidationError(
+        message,
+        validator=keyword,
+        validator_value=constraint.get(keyword),
+        instance=instance,
+        schema=constraint,
+        path=[tag],
+        schema_path=["properties", tag, keyword],
+    )
+    error.add_note(filepath)
+    return error
+
+
+def iter_numeric_errors(
+    sidecars: list[tuple[str, dict]],
+    constraints: dict[str, dict[str, dict]],
+    deviations: dict[tuple, list] | None = None,
+    series: str = "",
+) -> Iterator[ValidationError]:
+    # checks the numeric constraints for all sidecars of a series at once
+    # only the failing rows are mapped back to per-file errors
+
+    # Parameters:
+    #   sidecars: list of (filepath, prepared sidecar data), see schema.prepare_metadata and get_numeric_values
+    #   constraints: numeric constraints per instrument, see split_numeric_constraints
+    #   deviations: if provided, deviations from the expected values are appended per (tag, series, instrument)
+    #   series: name of the series (eg. the schema relpath) to key the deviations with
+
+    sidecars_by_instrument = {}
+    for filepath, sidecar_data in sidecars:
+        sidecars_by_instrument.setdefault(sidecar_data.get("__instrument__"), []).append((filepath, sidecar_data))
+
+    for instrument_key, instrument_sidecars in sidecars_by_instrument.items():
+        # sidecars from unknown instruments are reported by jsonschema on the residual schema
+        instrument_constraints = constraints.get(instrument_key, {})
+        filepaths = [filepath for filepath, _ in instrument_sidecars]
+        sidecars_data = [sidecar_data for _, sidecar_data in instrument_sidecars]
+
+        for tag, constraint in instrument_constraints.items():
+            tag_type = constraint["type"]
+            values, present, wrong_type = gather_numeric_values(sidecars_data, tag, tag_type == "integer")
+            numeric = present & ~wrong_type
+
+            for idx in np.flatnonzero(wrong_type):
+                instance = sidecars_data[idx][tag]
+                yield numeric_error(
+                    f"{instance!r} is not of type {tag_type!r}", tag, "type", constraint, instance, filepaths[idx]
+                )
+
+            if "const" in constraint:
+                expected = constraint["const"]
+                failing = numeric & (values != expected)
+                for idx in np.flatnonzero(failing):
+                    instance = sidecars_data[idx][tag]
+                    yield numeric_error(
+                        f"{expected!r} was expected", tag, "const", constraint, instance, filepaths[idx]
+                    )
+            else:
+                expected = (constraint.get("minimum", np.nan) + constraint.get("maximum", np.nan)) / 2
+                failing = np.zeros(len(sidecars_data), dtype=bool)
+                if "minimum" in constraint:
+                    below = numeric & (values < constraint["minimum"])
+                    failing |= below
+                    for idx in np.flatnonzero(below):
+                        instance = sidecars_data[idx][tag]
+                        yield numeric_error(
+                            f"{instance!r} is less than the minimum of {constraint['minimum']!r}",
+                            tag,
+                            "minimum",
+                            constraint,
+                            instance,
+                            filepaths[idx],
+                        )
+                if "maximum" in constraint:
+                    above = numeric & (values > constraint["maximum"])
+                    failing |= above
+                    for idx in np.flatnonzero(above):
+                        instance = sidecars_data[idx][tag]
+                        yield numeric_error(
+                            f"{instance!r} is greater than the maximum of {constraint['maximum']!r}",
+                            tag,
+                            "maximum",
+                            constraint,
+                            instance,
+                            filepaths[idx],
+                        )
+
+            if deviations is not None and not np.isnan(expected):
+                deviations.setdefault((tag, series, instrument_key), []).append(
+                    (values[numeric] - expected, failing[numeric])
+                )
+
+
+def summarize_deviations(deviations: dict[tuple, list]) -> list[dict]:
+    # computes statistics of the deviations gathered by iter_numeric_errors,
+    # one entry per (tag, series, instrument) as they have different expected values
+    summary = []
+    for (tag, series, instrument_key), tag_deviations in sorted(deviations.items()):
+        tag_failing = np.concatenate([failing for _, failing in tag_deviations])
+        tag_deviations = np.concatenate([deviation for deviation, _ in tag_deviations])
+        if not tag_deviations.size:
+            continue
+        summary.append(
+            {
+                "tag": tag,
+                "series": series,
+                "instrument": instrument_key,
+                "count": int(tag_deviations.size),
+                # values outside of the const or tolerance constraint
+                "failing": int(np.count_nonzero(tag_failing)),
+                "mean": float(tag_deviations.mean()),
+                "std": float(tag_deviations.std()),
+                "max_abs": float(np.abs(tag_deviations).max()),
+            }
+        )
+    return summary
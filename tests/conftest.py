@@ -10,8 +10,12 @@ In VSCode, Code Coverage is recorded in config.xml. Delete this file to reset re
 
 from __future__ import annotations
 
+import json
+import os
+import sys
 from typing import List
 
+import bids
 import pytest
 from _pytest.nodes import Item
 
@@ -24,7 +28,72 @@ def pytest_collection_modifyitems(items: list[Item]):
             item.add_marker(pytest.mark.integration)
 
 
+def pytest_terminal_summary(terminalreporter):
+    """Report the peak resident memory of the test session."""
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    max_rss_mb = max_rss / 2**20 if sys.platform == "darwin" else max_rss / 2**10
+    terminalreporter.write_line(f"peak RSS: {max_rss_mb:.1f} MB")
+
+
 @pytest.fixture
 def unit_test_mocks(monkeypatch: None):
     """Include Mocks here to execute all commands offline and fast."""
     pass
+
+
+T1W_SIDECAR = {
+    "EchoTime": 0.03,
+    "RepetitionTime": 2.0,
+    "ImagingFrequency": 123.2,
+    "Manufacturer": "Siemens",
+    "ManufacturersModelName": "Prisma",
+    "ReceiveCoilName": "HC32",
+    "SeriesDescription": "t1",
+}
+
+
+def write_bids_sidecar(bids_path, relpath: str, sidecar: dict):
+    path = os.path.join(bids_path, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wt") as fd:
+        json.dump(sidecar, fd)
+    open(path[: -len(".json")] + ".nii.gz", "wb").close()
+
+
+@pytest.fixture
+def t1w_sidecar():
+    """Return the metadata of the T1w sidecars of the bids_dataset fixture."""
+    return dict(T1W_SIDECAR)
+
+
+@pytest.fixture
+def write_sidecar():
+    """Return a function writing a sidecar and an empty matching nifti file in a dataset."""
+    return write_bids_sidecar
+
+
+@pytest.fixture
+def all_sessions():
+    """Return the subject/session query of all the subjects and sessions, as the CLI defaults."""
+    return {"subject": bids.layout.Query.ANY, "session": [bids.layout.Query.NONE, bids.layout.Query.ANY]}
+
+
+@pytest.fixture
+def bids_dataset(tmp_path):
+    """Return a function creating a small BIDS dataset with a T1w series for each subject."""
+
+    def make_dataset(name: str = "ds", subjects: tuple = ("01", "02", "03")) -> str:
+        bids_path = os.path.join(tmp_path, name)
+        os.makedirs(bids_path)
+        with open(os.path.join(bids_path, "dataset_description.json"), "wt") as fd:
+            json.dump({"Name": name, "BIDSVersion": "1.8.0"}, fd)
+        for subject in subjects:
+            write_bids_sidecar(bids_path, f"sub-{subject}/anat/sub-{subject}_T1w.json", T1W_SIDECAR)
+        return bids_path
+
+    return make_dataset
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+
+import bids
+import pytest
+
+from forbids import validation
+from forbids.batch import process_batch, read_datasets, validate_dataset
+from forbids.cli.run import main
+from forbids.init import initialize
+
+def test_read_datasets(tmp_path):
+    for site in ("site1", "site2", "site3"):
+        os.makedirs(os.path.join(tmp_path, site))
+    with open(os.path.join(tmp_path, "sites.txt"), "wt") as fd:
+        fd.write("# protocol sites\nsite1\n\nsite2\n")
+    with open(os.path.join(tmp_path, "sites.json"), "wt") as fd:
+        json.dump(["site3"], fd)
+
+    assert read_datasets(
+        [os.path.join(tmp_path, "sites.txt"), os.path.join(tmp_path, "sites.json"), os.path.join(tmp_path, "site1")]
+    ) == [os.path.join(tmp_path, site) for site in ("site1", "site2", "site3", "site1")]
+
+
+def test_read_datasets_invalid(tmp_path):
+    # missing datasets are kept to be reported as failing
+    assert read_datasets([os.path.join(tmp_path, "missing")]) == [os.path.join(tmp_path, "missing")]
+
+    for content in ({"site1": "site1"}, ["site1", 2], "site1"):
+        with open(os.path.join(tmp_path, "sites.json"), "wt") as fd:
+            json.dump(content, fd)
+        with pytest.raises(ValueError, match="list of dataset paths"):
+            read_datasets([os.path.join(tmp_path, "sites.json")])
+
+
+@pytest.fixture
+def site_datasets(bids_dataset, write_sidecar, t1w_sidecar):
+    # site1 and site2 share an identical bundle, site3 has a different one and site4 has none
+    site1 = bids_dataset("site1")
+    assert initialize(bids.BIDSLayout(site1))
+    site2 = bids_dataset("site2")
+    shutil.copytree(os.path.join(site1, ".forbids"), os.path.join(site2, ".forbids"))
+    write_sidecar(site2, "sub-02/anat/sub-02_T1w.json", dict(t1w_sidecar, EchoTime=0.04))
+    site3 = bids_dataset("site3")
+    for subject in ("01", "02", "03"):
+        write_sidecar(site3, f"sub-{subject}/anat/sub-{subject}_T1w.json", dict(t1w_sidecar, RepetitionTime=2.3))
+    assert initialize(bids.BIDSLayout(site3))
+    site4 = bids_dataset("site4")
+    yield site1, site2, site3, site4
+    validation.clear_caches()
+
+
+def test_validate_dataset_shares_bundles(site_datasets, all_sessions):
+    site1, site2, site3, site4 = site_datasets
+
+    assert validate_dataset(site1, **all_sessions)["compliant"]
+    assert len(validation.ref_layouts) == 1
+    summary = validate_dataset(site2, **all_sessions)
+    # identical bundle reuses the cached layout and schemas
+    assert len(validation.ref_layouts) == 1
+    assert len(validation.series_schemas) == 1
+    assert summary["errors"] == [
+        {
+            "type": "ValidationError",
+            "file": "sub-02/anat/sub-02_T1w.json",
+            "path": "EchoTime",
+            "message": "0.03 was expected",
+        }
+    ]
+
+    # a different bundle gets its own entries
+    assert validate_dataset(site3, **all_sessions)["compliant"]
+    assert len(validation.ref_layouts) == 2
+    assert {key[0] for key in validation.series_schemas} == set(validation.ref_layouts)
+
+    summary = validate_dataset(site4, **all_sessions)
+    assert not summary["compliant"]
+    assert summary["errors_by_type"] == {"DatasetError": 1}
+    assert ".forbids" in summary["errors"][0]["message"]
+
+
+def test_process_batch(site_datasets, all_sessions, tmp_path):
+    report_path = os.path.join(tmp_path, "report.json")
+    assert not process_batch(list(site_datasets), **all_sessions, vectorize=True, report_path=report_path)
+    # the caches are dropped at the end of the batch
+    assert not validation.ref_layouts and not validation.series_schemas
+
+    with open(report_path) as fd:
+        report = json.load(fd)
+    assert report["num_datasets"] == 4
+    assert report["num_compliant"] == 2
+    assert report["num_errors"] == 2
+    assert [summary["dataset"] for summary in report["datasets"]] == list(site_datasets)
+    assert [summary["compliant"] for summary in report["datasets"]] == [True, False, True, False]
+    assert report["datasets"][1]["errors_by_type"] == {"ValidationError": 1}
+    assert report["datasets"][3]["errors_by_type"] == {"DatasetError": 1}
+    echo_time = [d for d in report["datasets"][1]["deviations"] if d["tag"] == "EchoTime"]
+    assert len(echo_time) == 1 and echo_time[0]["failing"] == 1
+
+    assert process_batch(list(site_datasets[:1]), **all_sessions)
+
+
+def test_process_batch_missing_dataset(site_datasets, all_sessions, tmp_path):
+    missing = os.path.join(tmp_path, "does_not_exist")
+    report_path = os.path.join(tmp_path, "report.json")
+    assert not process_batch([site_datasets[0], missing], **all_sessions, report_path=report_path)
+
+    with open(report_path) as fd:
+        report = json.load(fd)
+    assert [summary["compliant"] for summary in report["datasets"]] == [True, False]
+    assert report["datasets"][1]["errors"] == [
+        {"type": "DatasetError", "message": f"dataset {missing} does not exist"}
+    ]
+
+
+def test_batch_invalid_listing(tmp_path, monkeypatch, capsys):
+    with open(os.path.join(tmp_path, "sites.json"), "wt") as fd:
+        json.dump({"a": "site1"}, fd)
+    monkeypatch.setattr(sys, "argv", ["forbids", "batch", os.path.join(tmp_path, "sites.json")])
+    with pytest.raises(SystemExit) as exit_info:
+        main()
+    assert exit_info.value.code == 2
+    assert "list of dataset paths" in capsys.readouterr().err
+
+
+def test_batch_exit_status(site_datasets, monkeypatch):
+    for datasets, status in ((site_datasets[:1], 0), (site_datasets, 1)):
+        monkeypatch.setattr(sys, "argv", ["forbids", "batch", *datasets, "--jobs", "2"])
+        with pytest.raises(SystemExit) as exit_info:
+            main()
+        assert exit_info.value.code == status
+
+
+def test_bundle_cache_is_bounded(site_datasets, all_sessions, monkeypatch):
+    site1, _, site3, _ = site_datasets
+    monkeypatch.setattr(validation, "MAX_CACHED_BUNDLES", 1)
+    validate_dataset(site1, **all_sessions)
+    site1_digest = next(iter(validation.ref_layouts))
+    validate_dataset(site3, **all_sessions)
+    assert len(validation.ref_layouts) == 1
+    assert site1_digest not in validation.ref_layouts
+    assert {key[0] for key in validation.series_schemas} == set(validation.ref_layouts)
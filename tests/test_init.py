@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import os
+
+import bids
+import pytest
+
+import forbids.init
+from forbids.init import MANIFEST_FILENAME, get_series_key, initialize, load_manifest, write_json_atomic
+
+
+def test_write_json_atomic(tmp_path):
+    path = os.path.join(tmp_path, "sub-ref_T1w.json")
+    write_json_atomic(path, {"EchoTime": 0.03})
+    with open(path) as fd:
+        assert json.load(fd) == {"EchoTime": 0.03}
+
+    # a failing serialization keeps the previous file and leaves no temporary file
+    with pytest.raises(TypeError):
+        write_json_atomic(path, {"EchoTime": object()})
+    with open(path) as fd:
+        assert json.load(fd) == {"EchoTime": 0.03}
+    assert os.listdir(tmp_path) == ["sub-ref_T1w.json"]
+
+
+def test_get_series_key():
+    key = get_series_key({"suffix": "T1w", "datatype": "anat", "acquisition": bids.layout.Query.NONE})
+    assert key == get_series_key({"datatype": "anat", "suffix": "T1w"})
+    assert json.loads(key) == {"datatype": "anat", "suffix": "T1w"}
+
+
+def init_dataset(bids_path, **kwargs):
+    # the layout has to be indexed again after the dataset is modified
+    return initialize(bids.BIDSLayout(bids_path), **kwargs)
+
+
+def get_manifest_hash(bids_path):
+    with open(os.path.join(bids_path, ".forbids", MANIFEST_FILENAME)) as fd:
+        manifest = json.load(fd)
+    return manifest["series"][T1W_KEY]["input_hash"]
+
+
+T1W_KEY = get_series_key({"datatype": "anat", "extension": ".json", "suffix": "T1w"})
+
+
+def test_initialize_resume(bids_dataset, write_sidecar, t1w_sidecar, mocker):
+    bids_path = bids_dataset()
+    schema_path = os.path.join(bids_path, ".forbids", "sub-ref", "anat", "sub-ref_T1w.json")
+    generate_spy = mocker.spy(forbids.init, "generate_series_model")
+
+    assert init_dataset(bids_path, resume=True)
+    assert generate_spy.call_count == 1
+    assert os.path.exists(schema_path)
+    input_hash = get_manifest_hash(bids_path)
+
+    # unchanged series are skipped
+    assert init_dataset(bids_path, resume=True)
+    assert generate_spy.call_count == 1
+    assert get_manifest_hash(bids_path) == input_hash
+
+    # without resume everything is regenerated
+    assert init_dataset(bids_path)
+    assert generate_spy.call_count == 2
+    assert get_manifest_hash(bids_path) == input_hash
+
+    # changed sidecar
+    write_sidecar(bids_path, "sub-03/anat/sub-03_T1w.json", dict(t1w_sidecar, SeriesDescription="t1_mprage"))
+    assert init_dataset(bids_path, resume=True)
+    assert generate_spy.call_count == 3
+    assert get_manifest_hash(bids_path) != input_hash
+    input_hash = get_manifest_hash(bids_path)
+
+    # new subject
+    write_sidecar(bids_path, "sub-04/anat/sub-04_T1w.json", t1w_sidecar)
+    assert init_dataset(bids_path, resume=True)
+    assert generate_spy.call_count == 4
+    assert get_manifest_hash(bids_path) != input_hash
+    input_hash = get_manifest_hash(bids_path)
+
+    # changed option
+    assert init_dataset(bids_path, resume=True, version_specific=True)
+    assert generate_spy.call_count == 5
+    assert get_manifest_hash(bids_path) != input_hash
+
+    # missing schema
+    os.remove(schema_path)
+    assert init_dataset(bids_path, resume=True, version_specific=True)
+    assert generate_spy.call_count == 6
+    assert os.path.exists(schema_path)
+
+
+def test_initialize_failed_series(bids_dataset, write_sidecar, t1w_sidecar, mocker):
+    bids_path = bids_dataset()
+    assert init_dataset(bids_path)
+    assert T1W_KEY in load_manifest(bids.BIDSLayout(bids_path))["series"]
+
+    # a series that fails is removed from the manifest and is not skipped when resuming
+    mocker.patch("forbids.init.generate_series_model", return_value=None)
+    write_sidecar(bids_path, "sub-03/anat/sub-03_T1w.json", dict(t1w_sidecar, SeriesDescription="t1_mprage"))
+    assert not init_dataset(bids_path, resume=True)
+    assert T1W_KEY not in load_manifest(bids.BIDSLayout(bids_path))["series"]
+
+
+@pytest.mark.parametrize("content", ['{"series": {"anat', '["not", "a", "manifest"]'])
+def test_initialize_corrupted_manifest(bids_dataset, mocker, content):
+    bids_path = bids_dataset()
+    assert init_dataset(bids_path)
+    with open(os.path.join(bids_path, ".forbids", MANIFEST_FILENAME), "wt") as fd:
+        fd.write(content)
+
+    # the corrupted manifest is discarded and the series generated again
+    generate_spy = mocker.spy(forbids.init, "generate_series_model")
+    assert init_dataset(bids_path, resume=True)
+    assert generate_spy.call_count == 1
+    assert T1W_KEY in load_manifest(bids.BIDSLayout(bids_path))["series"]
+
+
+def test_write_json_atomic_fsync(tmp_path, mocker):
+    fsync_spy = mocker.spy(os, "fsync")
+    write_json_atomic(os.path.join(tmp_path, "sub-ref_T1w.json"), {"EchoTime": 0.03})
+    assert fsync_spy.call_count == 1
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import json
+import tracemalloc
+from importlib.resources import files
+
+from forbids.records import SidecarRecord, get_config_tags
+
+# per-record footprint, a 100k-file audit keeps 10 times more records alive
+NUM_RECORDS = 10_000
+
+
+def get_mri_tags():
+    with open(files("forbids").joinpath("config/mri_tags.json")) as fd:
+        return get_config_tags(json.load(fd))
+
+
+def test_sidecar_record():
+    tags = get_mri_tags()
+    entities = {"subject": "01", "datatype": "anat", "suffix": "T1w", "extension": ".json"}
+    record = SidecarRecord(
+        "sub-01/anat/sub-01_T1w.json",
+        entities,
+        {"EchoTime": 0.03, "Manufacturer": "Siemens", "AcquisitionDateTime": "2024-01-01T10:00:00"},
+        tags,
+    )
+    assert record.entities == entities
+    # only the configured tags are kept
+    assert record.get_dict() == {"EchoTime": 0.03, "Manufacturer": "Siemens"}
+    assert not hasattr(record, "__dict__")
+
+    # build the strings at runtime so that they are not the same constants as above
+    datatype = "".join(["an", "at"])
+    other = SidecarRecord("sub-02/anat/sub-02_T1w.json", dict(entities, subject="02", datatype=datatype), {}, tags)
+    assert datatype is not entities["datatype"]
+    assert other.entities["datatype"] is record.entities["datatype"]
+    assert other.get_dict() == {}
+
+
+def test_sidecar_records_memory():
+    tags = get_mri_tags()
+    metadata = {tag: 0.03 for tag in tags[:30]}
+    metadata["Manufacturer"] = "Siemens"
+    metadata["AcquisitionDateTime"] = "2024-01-01T10:00:00"
+
+    tracemalloc.start()
+    try:
+        records = [
+            SidecarRecord(
+                f"sub-{i:06d}/anat/sub-{i:06d}_T1w.json",
+                {"subject": f"{i:06d}", "datatype": "anat", "suffix": "T1w", "extension": ".json"},
+                dict(metadata),
+                tags,
+            )
+            for i in range(NUM_RECORDS)
+        ]
+        records_size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(records) == NUM_RECORDS
+    assert records_size / NUM_RECORDS < 1024
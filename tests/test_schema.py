@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import os
+
 from apischema.json_schema import deserialization_schema
 
-from forbids.schema import tagpreset2type
+from forbids.schema import get_bundle_digest, tagpreset2type
 
 
 def test_tagpreset2type():
@@ -28,3 +30,18 @@ def test_tagpreset2type():
 
 def test_struct2schemaprops():
     pass
+
+
+def test_get_bundle_digest(tmp_path):
+    for bundle in ("site1", "site2"):
+        os.makedirs(os.path.join(tmp_path, bundle, "sub-ref", "anat"))
+        with open(os.path.join(tmp_path, bundle, "sub-ref", "anat", "sub-ref_T1w.json"), "wt") as fd:
+            fd.write('{"type": "object"}')
+    # dotfiles such as the init manifest are ignored
+    with open(os.path.join(tmp_path, "site2", ".init_manifest.json"), "wt") as fd:
+        fd.write("{}")
+    assert get_bundle_digest(os.path.join(tmp_path, "site1")) == get_bundle_digest(os.path.join(tmp_path, "site2"))
+
+    with open(os.path.join(tmp_path, "site2", "sub-ref", "anat", "sub-ref_T1w.json"), "wt") as fd:
+        fd.write('{"type": "array"}')
+    assert get_bundle_digest(os.path.join(tmp_path, "site1")) != get_bundle_digest(os.path.join(tmp_path, "site2"))
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import bids
+import pytest
+
+from forbids.init import initialize
+from forbids.validation import BIDSFileError, validate
+
+@pytest.fixture
+def initialized_dataset(bids_dataset):
+    bids_path = bids_dataset()
+    assert initialize(bids.BIDSLayout(bids_path))
+    return bids_path
+
+
+def get_errors(bids_path, query, vectorize=False):
+    return list(validate(bids.BIDSLayout(bids_path), vectorize=vectorize, **query))
+
+
+@pytest.mark.parametrize("vectorize", [False, True])
+def test_validate_compliant(initialized_dataset, all_sessions, vectorize):
+    assert get_errors(initialized_dataset, all_sessions, vectorize) == []
+
+
+def test_validate_unexpected_sidecar(initialized_dataset, write_sidecar, t1w_sidecar, all_sessions):
+    write_sidecar(initialized_dataset, "sub-02/anat/sub-02_T2w.json", t1w_sidecar)
+    errors = get_errors(initialized_dataset, all_sessions)
+    assert len(errors) == 1
+    assert isinstance(errors[0], BIDSFileError)
+    assert errors[0].message == "Unexpected BIDS file sub-02/anat/sub-02_T2w.json"
+
+
+@pytest.mark.parametrize("vectorize", [False, True])
+def test_validate_wrong_tag(initialized_dataset, write_sidecar, t1w_sidecar, all_sessions, vectorize):
+    write_sidecar(initialized_dataset, "sub-03/anat/sub-03_T1w.json", dict(t1w_sidecar, EchoTime=0.04))
+    errors = get_errors(initialized_dataset, all_sessions, vectorize)
+    assert len(errors) == 1
+    assert errors[0].__notes__ == ["sub-03/anat/sub-03_T1w.json"]
+    assert list(errors[0].absolute_path) == ["EchoTime"]
+    assert errors[0].message == "0.03 was expected"
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from typing import Annotated, Union
+
+from apischema import discriminator
+from apischema.json_schema import deserialization_schema
+
+from forbids.schema import get_validator, sidecar2schema
+from forbids.vectorized import (
+    get_numeric_values,
+    iter_numeric_errors,
+    split_numeric_constraints,
+    summarize_deviations,
+)
+
+CONFIG_PROPS = {
+    "EchoTime": "=",
+    "ImagingFrequency": "~=.5",
+    "Manufacturer": "=",
+    "__instrument__": "=",
+}
+
+
+def get_series_schema():
+    siemens = sidecar2schema(
+        {"EchoTime": 0.03, "ImagingFrequency": 123.2, "Manufacturer": "Siemens", "__instrument__": "Siemens"},
+        CONFIG_PROPS,
+        "seriesSiemens",
+    )
+    ge = sidecar2schema(
+        {"EchoTime": 0.031, "ImagingFrequency": 127.0, "Manufacturer": "GE", "__instrument__": "GE"},
+        CONFIG_PROPS,
+        "seriesGE",
+    )
+    union = Annotated[Union[siemens, ge], discriminator("__instrument__")]
+    return deserialization_schema(union, additional_properties=True)
+
+
+def test_split_numeric_constraints():
+    sidecar_schema = get_series_schema()
+    residual_schema, constraints = split_numeric_constraints(sidecar_schema)
+
+    assert constraints == {
+        "Siemens": {
+            "EchoTime": {"type": "number", "const": 0.03},
+            "ImagingFrequency": {"type": "number", "minimum": 122.7, "maximum": 123.7},
+        },
+        "GE": {
+            "EchoTime": {"type": "number", "const": 0.031},
+            "ImagingFrequency": {"type": "number", "minimum": 126.5, "maximum": 127.5},
+        },
+    }
+    siemens_schema = residual_schema["$defs"]["seriesSiemens"]
+    assert set(siemens_schema["properties"]) == {"Manufacturer", "__instrument__"}
+    assert "EchoTime" in siemens_schema["required"]
+    # the original schema is left untouched
+    assert "EchoTime" in sidecar_schema["$defs"]["seriesSiemens"]["properties"]
+
+
+def test_split_numeric_constraints_ambiguous_instrument():
+    sidecar_schema = {
+        "oneOf": [{"$ref": "#/$defs/a"}, {"$ref": "#/$defs/b"}, {"$ref": "#/$defs/c"}],
+        "$defs": {
+            name: {
+                "type": "object",
+                "properties": {
+                    "EchoTime": {"type": "number", "const": echo_time},
+                    "__instrument__": {"type": "string", "const": instrument},
+                },
+                "required": ["EchoTime", "__instrument__"],
+            }
+            for name, echo_time, instrument in (("a", 0.03, "X"), ("b", 0.05, "X"), ("c", 0.04, "Y"))
+        },
+    }
+    residual_schema, constraints = split_numeric_constraints(sidecar_schema)
+
+    # the subschemas sharing an instrument are all left to jsonschema
+    assert constraints == {"Y": {"EchoTime": {"type": "number", "const": 0.04}}}
+    assert residual_schema["$defs"]["a"] == sidecar_schema["$defs"]["a"]
+    assert residual_schema["$defs"]["b"] == sidecar_schema["$defs"]["b"]
+    assert "EchoTime" not in residual_schema["$defs"]["c"]["properties"]
+    sidecars = [("sub-01.json", {"EchoTime": 0.05, "__instrument__": "X"})]
+    assert list(iter_numeric_errors(sidecars, constraints)) == []
+
+
+def test_iter_numeric_errors():
+    sidecar_schema = get_series_schema()
+    _, constraints = split_numeric_constraints(sidecar_schema)
+    sidecars = [
+        ("sub-01.json", {"EchoTime": 0.03, "ImagingFrequency": 123.0, "__instrument__": "Siemens"}),
+        ("sub-02.json", {"EchoTime": 0.04, "ImagingFrequency": 124.0, "__instrument__": "Siemens"}),
+        ("sub-03.json", {"EchoTime": "0.03", "ImagingFrequency": 123.2, "__instrument__": "Siemens"}),
+        ("sub-04.json", {"EchoTime": 0.031, "ImagingFrequency": 126.0, "__instrument__": "GE"}),
+        ("sub-05.json", {"__instrument__": "GE"}),
+    ]
+    deviations = {}
+    errors = list(iter_numeric_errors(sidecars, constraints, deviations))
+    # only the constrained values are needed
+    numeric_sidecars = [(path, get_numeric_values(sidecar_data, constraints)) for path, sidecar_data in sidecars]
+    assert numeric_sidecars[0][1] == {"EchoTime": 0.03, "ImagingFrequency": 123.0, "__instrument__": "Siemens"}
+    assert [(e.__notes__, e.message) for e in iter_numeric_errors(numeric_sidecars, constraints)] == [
+        (e.__notes__, e.message) for e in errors
+    ]
+
+    assert sorted((e.__notes__[0], e.path[0], e.validator) for e in errors) == [
+        ("sub-02.json", "EchoTime", "const"),
+        ("sub-02.json", "ImagingFrequency", "maximum"),
+        ("sub-03.json", "EchoTime", "type"),
+        ("sub-04.json", "ImagingFrequency", "minimum"),
+    ]
+
+    # same messages as the ones from jsonschema on the full schema
+    validator = get_validator(sidecar_schema)
+    schema_errors = {
+        (path, e.path[0], e.message)
+        for path, sidecar_data in sidecars
+        for error in validator.iter_errors(sidecar_data)
+        for e in error.context
+        if e.path
+    }
+    for error in errors:
+        assert (error.__notes__[0], error.path[0], error.message) in schema_errors
+
+    # one entry per tag and instrument as the expected values differ
+    summary = {(s["tag"], s["instrument"]): s for s in summarize_deviations(deviations)}
+    assert set(summary) == {
+        ("EchoTime", "Siemens"),
+        ("EchoTime", "GE"),
+        ("ImagingFrequency", "Siemens"),
+        ("ImagingFrequency", "GE"),
+    }
+    assert summary[("EchoTime", "Siemens")]["count"] == 2
+    assert summary[("EchoTime", "Siemens")]["failing"] == 1
+    assert summary[("EchoTime", "GE")]["count"] == 1
+    assert summary[("EchoTime", "GE")]["failing"] == 0
+    # values within the tolerance are not failing even if not exactly at the expected value
+    assert summary[("ImagingFrequency", "Siemens")]["count"] == 3
+    assert summary[("ImagingFrequency", "Siemens")]["failing"] == 1
+    assert summary[("ImagingFrequency", "Siemens")]["max_abs"] > 0.5
+    assert summary[("ImagingFrequency", "GE")]["failing"] == 1